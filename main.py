@@ -1,13 +1,77 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.responses import StreamingResponse
-from typing import Dict
-from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from functools import lru_cache
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from io import BytesIO, TextIOWrapper
 from docx import Document
 from docx.shared import Pt, RGBColor, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import json, re
+from docx.oxml import OxmlElement
+from docx.oxml.ns import nsdecls, qn
+from docx.text.paragraph import Paragraph
+from lxml import etree
+from xml.sax.saxutils import escape
+import asyncio, itertools, json, multiprocessing, os, posixpath, re, time, zipfile
 
-app = FastAPI(title="WorkDocStyler API")
+# Inputs longer than one chunk are styled in parallel, one chunk per pool task.
+# No pool (serial styling) on single-CPU hosts, where it is pure overhead.
+_CHUNK_LINES = 5000
+_POOL: Optional[ProcessPoolExecutor] = None
+
+def _new_pool() -> Optional[ProcessPoolExecutor]:
+    if (os.cpu_count() or 1) < 2:
+        return None
+    # spawn, not fork: the server process already runs threads
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    global _POOL
+    _POOL = _new_pool()
+    try:
+        yield
+    finally:
+        if _POOL is not None:
+            _POOL.shutdown(cancel_futures=True)
+            _POOL = None
+
+app = FastAPI(title="WorkDocStyler API", lifespan=_lifespan)
+
+# All line markers fused into one compiled pattern; the matching group names the line kind.
+# Numbered lists are simple detection only: "1. ", "1) ", "a. ", "A) "
+# The trailing \s* eats the whitespace after the marker, so only an rstrip() is left to do
+_LINE_CLASSIFY = re.compile(
+    r"(?:(?P<h4>#### |H4:)|(?P<h3>### |H3:)|(?P<h2>## |H2:)|(?P<h1># |H1:)"
+    r"|(?P<num>(?:\d+|[A-Za-z])[.\)]\s)|(?P<bul>[-*•] ))\s*"
+)
+
+# Styles the classifier can emit, addressed by integer id on the per-line path
+_STYLE_NAMES = ("Heading 1", "Heading 2", "Heading 3", "Heading 4",
+                "Normal", "Normal Bullet", "List Paragraph Bullet Points")
+_STYLE_ID = {name: sid for sid, name in enumerate(_STYLE_NAMES)}
+_NORMAL_ID = _STYLE_ID["Normal"]
+# Line kind -> style id; "bul" is resolved against each style map in _compile_rules
+_KIND_SID = {"h1": _STYLE_ID["Heading 1"], "h2": _STYLE_ID["Heading 2"], "h3": _STYLE_ID["Heading 3"],
+             "h4": _STYLE_ID["Heading 4"], "num": _NORMAL_ID}
+
+# Run content: tabs and line breaks become their own elements, as python-docx does;
+# other characters that are not allowed in XML are dropped
+_RUN_SPECIAL_RE = re.compile("([\t\r\n\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff])")
+_RUN_SPECIAL_XML = {"\t": "<w:tab/>", "\r": "<w:br/>", "\n": "<w:br/>"}
+_W_NSDECL = " " + nsdecls("w")
+_T_OPEN = '<w:t xml:space="preserve">'
+_P_CLOSE = b"</w:r></w:p>"
+_P_TEXT_CLOSE = b"</w:t></w:r></w:p>"
+
+# Input .docx: element tags needed to pull paragraph text out of document.xml
+_W_BODY, _W_P, _W_R, _W_HYPERLINK = qn("w:body"), qn("w:p"), qn("w:r"), qn("w:hyperlink")
+_W_T, _W_BR, _W_TYPE = qn("w:t"), qn("w:br"), qn("w:type")
+_RELS_PARSER = etree.XMLParser(resolve_entities=False)
+_RUN_TEXT_TAGS = {qn("w:tab"): "\t", qn("w:ptab"): "\t", qn("w:cr"): "\n", qn("w:noBreakHyphen"): "-"}
 
 # --- Arkance Style Map: default embedded (you can override via style_map_json) ---
 DEFAULT_STYLE_MAP = {
@@ -77,106 +141,340 @@ def _rgb(color_str: str):
             pass
     return RGBColor(0,0,0)  # fallback for "Text 1/2" etc.
 
-def _apply_paragraph_style(p, spec: Dict):
-    align_map = {"Left": WD_ALIGN_PARAGRAPH.LEFT, "Center": WD_ALIGN_PARAGRAPH.CENTER,
-                 "Right": WD_ALIGN_PARAGRAPH.RIGHT, "Justify": WD_ALIGN_PARAGRAPH.JUSTIFY}
-    if spec.get("alignment") in align_map:
-        p.alignment = align_map[spec["alignment"]]
-    if "line_spacing" in spec: p.paragraph_format.line_spacing = spec["line_spacing"]
-    if "spacing_before_pt" in spec: p.paragraph_format.space_before = Pt(spec["spacing_before_pt"])
-    if "spacing_after_pt" in spec: p.paragraph_format.space_after = Pt(spec["spacing_after_pt"])
-    if "indent_left_cm" in spec: p.paragraph_format.left_indent = Cm(spec["indent_left_cm"])
-    if "indent_hanging_cm" in spec: p.paragraph_format.first_line_indent = -Cm(spec["indent_hanging_cm"])
-    if spec.get("keep_with_next"): p.paragraph_format.keep_with_next = True
-    if spec.get("keep_lines_together"): p.paragraph_format.keep_together = True
+_ALIGN_MAP = {"Left": WD_ALIGN_PARAGRAPH.LEFT, "Center": WD_ALIGN_PARAGRAPH.CENTER,
+              "Right": WD_ALIGN_PARAGRAPH.RIGHT, "Justify": WD_ALIGN_PARAGRAPH.JUSTIFY}
+
+@dataclass(slots=True)
+class CompiledSpec:
+    """A style spec with its values pre-resolved; None means "leave unset"."""
+    alignment: Optional[WD_ALIGN_PARAGRAPH] = None
+    line_spacing: Optional[float] = None
+    space_before: Optional[Pt] = None
+    space_after: Optional[Pt] = None
+    left_indent: Optional[Cm] = None
+    first_line_indent: Optional[int] = None
+    font_name: Optional[str] = None
+    font_size: Optional[Pt] = None
+    bold: Optional[bool] = None
+    italic: Optional[bool] = None
+    rgb: Optional[RGBColor] = None
+    keep_with_next: bool = False
+    keep_lines_together: bool = False
+    # Per-style XML, partially evaluated once: only the run text varies per line
+    p_blank: bytes = b""  # whole paragraph for a blank line
+    p_run: bytes = b""    # "<w:p>pPr<w:r>rPr", for text with tabs/breaks
+    p_text: bytes = b""   # p_run + "<w:t>", for plain text
+
+def _apply_paragraph_style(p, spec: CompiledSpec):
+    pf = p.paragraph_format
+    if spec.alignment is not None: p.alignment = spec.alignment
+    if spec.line_spacing is not None: pf.line_spacing = spec.line_spacing
+    if spec.space_before is not None: pf.space_before = spec.space_before
+    if spec.space_after is not None: pf.space_after = spec.space_after
+    if spec.left_indent is not None: pf.left_indent = spec.left_indent
+    if spec.first_line_indent is not None: pf.first_line_indent = spec.first_line_indent
+    if spec.keep_with_next: pf.keep_with_next = True
+    if spec.keep_lines_together: pf.keep_together = True
 
     runs = p.runs or [p.add_run("")]
     for r in runs:
-        if "font_name" in spec: r.font.name = spec["font_name"]
-        if "font_size_pt" in spec: r.font.size = Pt(spec["font_size_pt"])
-        if "bold" in spec: r.font.bold = spec["bold"]
-        if "italic" in spec: r.font.italic = spec["italic"]
-        if "color" in spec: r.font.color.rgb = _rgb(spec["color"])
-
-def _add_styled_paragraph(doc: Document, text: str, style_name: str, rules: Dict, counters: Dict):
-    p = doc.add_paragraph(text)
-    _apply_paragraph_style(p, rules.get(style_name, {}))
-    counters[style_name] = counters.get(style_name, 0) + 1
-
-def _detect_and_style_line(doc, line: str, rules: Dict, counters: Dict):
-    # Normalize line and strip any UTF-8 BOM if present (common on first line)
+        if spec.font_name is not None: r.font.name = spec.font_name
+        if spec.font_size is not None: r.font.size = spec.font_size
+        if spec.bold is not None: r.font.bold = spec.bold
+        if spec.italic is not None: r.font.italic = spec.italic
+        if spec.rgb is not None: r.font.color.rgb = spec.rgb
+
+def _xml_fragment(elem) -> str:
+    if elem is None:
+        return ""
+    return etree.tostring(elem, encoding="unicode").replace(_W_NSDECL, "")
+
+def _render_fragments(spec: CompiledSpec) -> CompiledSpec:
+    """Serialize the spec's <w:pPr>/<w:rPr> once, by styling a scratch paragraph."""
+    p = Paragraph(OxmlElement("w:p"), None)
+    _apply_paragraph_style(p, spec)
+    ppr_xml = _xml_fragment(p._p.pPr)
+    rpr_xml = _xml_fragment(p.runs[0]._r.rPr)
+    spec.p_blank = f"<w:p>{ppr_xml}</w:p>".encode("utf-8")
+    spec.p_run = f"<w:p>{ppr_xml}<w:r>{rpr_xml}".encode("utf-8")
+    spec.p_text = spec.p_run + _T_OPEN.encode("utf-8")
+    return spec
+
+def _compile_spec(spec: Dict) -> CompiledSpec:
+    return _render_fragments(CompiledSpec(
+        alignment=_ALIGN_MAP.get(spec.get("alignment")),
+        line_spacing=spec.get("line_spacing"),
+        space_before=Pt(spec["spacing_before_pt"]) if "spacing_before_pt" in spec else None,
+        space_after=Pt(spec["spacing_after_pt"]) if "spacing_after_pt" in spec else None,
+        left_indent=Cm(spec["indent_left_cm"]) if "indent_left_cm" in spec else None,
+        first_line_indent=-Cm(spec["indent_hanging_cm"]) if "indent_hanging_cm" in spec else None,
+        font_name=spec.get("font_name"),
+        font_size=Pt(spec["font_size_pt"]) if "font_size_pt" in spec else None,
+        bold=spec.get("bold"),
+        italic=spec.get("italic"),
+        rgb=_rgb(spec["color"]) if "color" in spec else None,
+        keep_with_next=bool(spec.get("keep_with_next")),
+        keep_lines_together=bool(spec.get("keep_lines_together")),
+    ))
+
+_EMPTY_SPEC = _render_fragments(CompiledSpec())
+
+@dataclass(slots=True)
+class CompiledRules:
+    rules: Dict                          # the raw style map
+    specs: List[Optional[CompiledSpec]]  # indexed by style id; None until first used
+    kind_sid: Dict[str, int]             # classifier group name -> style id
+
+def _compile_rules(rules: Dict) -> CompiledRules:
+    """Set up per-style-id compilation; each spec is compiled the first time a line uses it."""
+    bullet = "Normal Bullet" if "Normal Bullet" in rules else "List Paragraph Bullet Points"
+    return CompiledRules(rules, [None] * len(_STYLE_NAMES), {**_KIND_SID, "bul": _STYLE_ID[bullet]})
+
+def _resolve_spec(compiled: CompiledRules, sid: int) -> CompiledSpec:
+    # Lazily, so a malformed entry for a style the draft never uses doesn't fail the request
+    name = _STYLE_NAMES[sid]
+    spec = _compile_spec(compiled.rules[name]) if name in compiled.rules else _EMPTY_SPEC
+    compiled.specs[sid] = spec
+    return spec
+
+@lru_cache(maxsize=64)
+def _load_rules(style_map_json: Optional[str]) -> CompiledRules:
+    """Parse and compile a style map; repeat requests with the same payload reuse the result.
+
+    The returned table is shared between requests and must not be mutated.
+    """
+    rules = DEFAULT_STYLE_MAP
+    if style_map_json:
+        try:
+            rules = json.loads(style_map_json)
+        except:
+            raise HTTPException(400, "Invalid style_map_json JSON")
+    return _compile_rules(rules)
+
+def _run_content_xml(text: str) -> str:
+    parts = []
+    for i, piece in enumerate(_RUN_SPECIAL_RE.split(text)):
+        if i % 2:  # a captured special character
+            parts.append(_RUN_SPECIAL_XML.get(piece, ""))
+        elif piece:
+            parts.append(_T_OPEN + escape(piece) + "</w:t>")
+    return "".join(parts)
+
+def _add_styled_paragraph(out: List[bytes], text: str, sid: int, rules: CompiledRules, counters: Dict[int, int]):
+    # Emit <w:p> straight from the style's pre-serialized properties instead of
+    # going through add_paragraph() and the paragraph_format/font setters
+    spec = rules.specs[sid] or _resolve_spec(rules, sid)
+    if not text:
+        # Blank line: paragraph properties only, no empty styled run
+        out.append(spec.p_blank)
+    elif _RUN_SPECIAL_RE.search(text) is None:
+        out.append(spec.p_text + escape(text).encode("utf-8") + _P_TEXT_CLOSE)
+    else:
+        out.append(spec.p_run + _run_content_xml(text).encode("utf-8") + _P_CLOSE)
+    counters[sid] = counters.get(sid, 0) + 1
+
+def _detect_and_style_line(out: List[bytes], line: str, rules: CompiledRules, counters: Dict[int, int]):
+    # Normalize line (a UTF-8 BOM is already stripped once by the reader)
     text = (line or "").rstrip("\r\n")
-    if text.startswith("\ufeff"):
-        text = text[1:]
-
-    # Headings by markers
-    heading_markers = [
-        ("Heading 1", ["H1:", "# "]),
-        ("Heading 2", ["H2:", "## "]),
-        ("Heading 3", ["H3:", "### "]),
-        ("Heading 4", ["H4:", "#### "]),
-    ]
-    for style_name, prefixes in heading_markers:
-        for pref in prefixes:
-            if text.startswith(pref):
-                clean = text[len(pref):].strip()
-                _add_styled_paragraph(doc, clean, style_name, rules, counters)
-                return
-
-    # Numbered lists (simple detection: "1. ", "1) ", "a. ", "A) ")
-    numbered_re = r"^(\d+[\.\)]\s|[A-Za-z][\.\)]\s)"
-    if re.match(numbered_re, text):
-        clean = re.sub(numbered_re, "", text).strip()
-        _add_styled_paragraph(doc, clean, "Normal", rules, counters)
-        return
 
-    # Bullets (- / * / • )
-    if any(text.startswith(m) for m in ["- ", "* ", "• "]):
-        clean = text[2:].strip() if len(text) >= 2 else ""
-        style_choice = "Normal Bullet" if "Normal Bullet" in rules else "List Paragraph Bullet Points"
-        _add_styled_paragraph(doc, clean, style_choice, rules, counters)
+    # Headings, numbered lists and bullets in a single regex scan
+    m = _LINE_CLASSIFY.match(text)
+    if m:
+        clean = text[m.end():].rstrip()
+        _add_styled_paragraph(out, clean, rules.kind_sid[m.lastgroup], rules, counters)
         return
 
     # Default = Normal
-    _add_styled_paragraph(doc, text, "Normal", rules, counters)
+    _add_styled_paragraph(out, text, _NORMAL_ID, rules, counters)
+
+def _style_chunk(lines: List[str], style_map_json: Optional[str]) -> Tuple[bytes, Dict[int, int]]:
+    """Render a run of lines to <w:p> XML; also the process-pool task for large inputs.
+
+    Counts are keyed by style id, in first-seen order.
+    """
+    rules = _load_rules(style_map_json)  # cached per worker process after the first chunk
+    counters: Dict[int,int] = {}
+    out: List[bytes] = []
+    for line in lines:
+        _detect_and_style_line(out, line, rules, counters)
+    return b"".join(out), counters
+
+async def _style_chunks_in_pool(chunks: List[List[str]], style_map_json: Optional[str]) -> List[Tuple[bytes, Dict[int, int]]]:
+    global _POOL
+    pool = _POOL
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.gather(*(
+            loop.run_in_executor(pool, _style_chunk, chunk, style_map_json) for chunk in chunks
+        ))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed, possibly on this very input): replace the
+        # pool for later requests, but don't retry this one inside the server process
+        if _POOL is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _POOL = _new_pool()
+        raise HTTPException(503, "Formatting worker failed, please retry")
+
+def _style_chunks(chunks: Iterable[List[str]], style_map_json: Optional[str]) -> List[Tuple[bytes, Dict[int, int]]]:
+    return [_style_chunk(chunk, style_map_json) for chunk in chunks]
+
+def _batched(lines: Iterable[str], n: int) -> Iterator[List[str]]:
+    it = iter(lines)
+    while batch := list(itertools.islice(it, n)):
+        yield batch
+
+def _read_txt(data: bytes) -> Iterator[str]:
+    # Decode incrementally instead of materializing the whole text and a list of lines;
+    # splitlines() on each line keeps the other separators (\v, \f, \u2028, ...) working.
+    # "utf-8-sig" drops a leading BOM once, so the per-line path never has to check for it
+    reader = TextIOWrapper(BytesIO(data), encoding="utf-8-sig", errors="ignore", newline="")
+    for raw in reader:
+        yield from raw.splitlines()
+
+def _main_part_name(z: zipfile.ZipFile) -> str:
+    rels = etree.fromstring(z.read("_rels/.rels"), _RELS_PARSER)
+    for rel in rels:
+        if rel.get("Type", "").endswith("/officeDocument"):
+            # package-level targets are relative to the root: "word/...", "/word/...", "./word/..."
+            name = posixpath.normpath(rel.get("Target", "")).lstrip("/")
+            if name in z.namelist():
+                return name
+    return "word/document.xml"
+
+def _run_text(r) -> str:
+    parts = []
+    for e in r:
+        if e.tag == _W_T:
+            parts.append(e.text or "")
+        elif e.tag == _W_BR:
+            # only text-wrapping breaks are newlines; page/column breaks carry no text
+            parts.append("\n" if e.get(_W_TYPE, "textWrapping") == "textWrapping" else "")
+        else:
+            parts.append(_RUN_TEXT_TAGS.get(e.tag, ""))
+    return "".join(parts)
+
+def _read_docx(data: bytes) -> Iterator[str]:
+    # Same text as python-docx's Document(...).paragraphs[i].text, but without building the
+    # object model: body-level <w:p> are streamed with iterparse and cleared once read
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        xml = z.read(_main_part_name(z))
+    first = True
+    for _, p in etree.iterparse(BytesIO(xml), tag=_W_P, remove_blank_text=True, resolve_entities=False):
+        body = p.getparent()
+        if body is None or body.tag != _W_BODY:
+            continue  # table cells, text boxes, content controls: not in Document.paragraphs
+        runs = []
+        for child in p:
+            if child.tag == _W_R:
+                runs.append(_run_text(child))
+            elif child.tag == _W_HYPERLINK:
+                runs.extend(_run_text(r) for r in child if r.tag == _W_R)
+        text = "".join(runs)
+        if first:
+            # a pasted-in BOM lands at the start of the first paragraph, as in .txt files
+            text = text.removeprefix("\ufeff")
+            first = False
+        yield text
+        p.clear()
+        while p.getprevious() is not None:
+            del body[0]
+
+# Input extension (lowercased) -> reader yielding the draft's lines
+_READERS = {".txt": _read_txt, ".docx": _read_docx}
+
+def _load_template():
+    """Split python-docx's default package into fixed parts and the document.xml shell."""
+    buf = BytesIO()
+    Document().save(buf)
+    with zipfile.ZipFile(buf) as z:
+        parts = [(i.filename, z.read(i)) for i in z.infolist()]
+    document_xml = dict(parts)["word/document.xml"]
+    body_start = document_xml.index(b"<w:body>") + len(b"<w:body>")
+    body_end = document_xml.index(b"<w:sectPr", body_start)
+    return parts, document_xml[:body_start], document_xml[body_end:]
+
+_TEMPLATE_PARTS, _DOCUMENT_HEAD, _DOCUMENT_TAIL = _load_template()
+
+class _ChunkSink:
+    """Unseekable write target for ZipFile; the stream generator drains it as it goes."""
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return iter(chunks)
+
+def _stream_docx(body_xml: List[bytes]) -> Iterator[bytes]:
+    # Zip is written incrementally: template parts verbatim, then document.xml
+    # one styled chunk of paragraphs at a time, yielding compressed bytes as soon as they exist
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, blob in _TEMPLATE_PARTS:
+            if name != "word/document.xml":
+                zf.writestr(name, blob)
+                yield from sink.drain()
+                continue
+            # The body is already built, so the size is known: zipfile only adds ZIP64
+            # fields when document.xml is actually that large
+            zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.file_size = len(_DOCUMENT_HEAD) + sum(map(len, body_xml)) + len(_DOCUMENT_TAIL)
+            with zf.open(zinfo, "w") as doc_xml:
+                doc_xml.write(_DOCUMENT_HEAD)
+                for xml in body_xml:
+                    doc_xml.write(xml)
+                    yield from sink.drain()
+                doc_xml.write(_DOCUMENT_TAIL)
+    yield from sink.drain()
 
 @app.post("/format")
 async def format_doc(
     draft: UploadFile = File(..., description=".txt or .docx"),
     style_map_json: str = Form(None, description="Optional: override style map")
 ):
-    # Decide which rules to use
-    rules = DEFAULT_STYLE_MAP
-    if style_map_json:
-        try:
-            rules = json.loads(style_map_json)
-        except:
-            raise HTTPException(400, "Invalid style_map_json JSON")
+    # Decide which rules to use (validates the JSON before any work is done)
+    _load_rules(style_map_json)
 
     # Read input file
+    # rpartition, not splitext: a bare ".txt" filename is still a .txt upload
+    _, dot, suffix = (draft.filename or "").rpartition(".")
+    ext = dot + suffix.lower()
+    reader = _READERS.get(ext)
+    if reader is None:
+        raise HTTPException(400, "Unsupported file (use .txt or .docx)")
     data = await draft.read()
-    out_doc = Document()
+    lines = reader(data)
 
-    if draft.filename.lower().endswith(".txt"):
-        lines = data.decode("utf-8", errors="ignore").splitlines()
-    elif draft.filename.lower().endswith(".docx"):
-        src = Document(BytesIO(data))
-        lines = [p.text for p in src.paragraphs]
+    # Build output (all lines first: the delta report goes out in the headers)
+    batches = _batched(lines, _CHUNK_LINES)
+    first = next(batches, [])
+    if len(first) < _CHUNK_LINES:
+        results = [_style_chunk(first, style_map_json)]
+    elif _POOL is None:
+        # no pool (single CPU): style off the event loop so other requests keep being served
+        results = await asyncio.to_thread(_style_chunks, itertools.chain([first], batches), style_map_json)
     else:
-        raise HTTPException(400, "Unsupported file (use .txt or .docx)")
+        results = await _style_chunks_in_pool([first, *batches], style_map_json)
 
-    # Build output
-    counters: Dict[str,int] = {}
-    for line in lines:
-        _detect_and_style_line(out_doc, line, rules, counters)
+    counters: Dict[int,int] = {}
+    body_xml: List[bytes] = []
+    for xml, chunk_counters in results:
+        body_xml.append(xml)
+        for sid, n in chunk_counters.items():
+            counters[sid] = counters.get(sid, 0) + n
 
     # Stream .docx back
-    buf = BytesIO()
-    out_doc.save(buf)
-    buf.seek(0)
-    headers = {"X-Delta-Report": json.dumps(counters)}
+    report = {_STYLE_NAMES[sid]: n for sid, n in counters.items()}
+    headers = {"X-Delta-Report": json.dumps(report)}
     return StreamingResponse(
-        buf,
+        _stream_docx(body_xml),
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers=headers
     )